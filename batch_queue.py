@@ -0,0 +1,338 @@
+"""Распределённая пакетная очистка через файловую очередь задач.
+
+Координатор раскладывает тайлы по JSON-файлам в каталоге очереди (на общем
+диске), воркеры на любых узлах забирают задачи атомарным переименованием
+с арендой (lease), продлевают её пока работают и записывают результат.
+Просроченные аренды возвращаются в очередь.
+
+    queue_dir/pending/   - задачи, ожидающие выполнения
+    queue_dir/leased/    - задачи в работе (mtime файла = последнее продление)
+    queue_dir/done/      - результаты выполненных задач
+    queue_dir/failed/    - задачи, исчерпавшие число попыток
+"""
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+import traceback
+import multiprocessing
+
+from local_filter import process_las_file, full_filter_las
+
+QUEUE_STATES = ("pending", "leased", "done", "failed")
+DEFAULT_LEASE_SECONDS = 600
+DEFAULT_MAX_ATTEMPTS = 3
+POLL_SECONDS = 5
+
+
+def _state_dir(queue_dir, state):
+    return os.path.join(queue_dir, state)
+
+
+def _write_json_atomic(file_path, data):
+    """Записать JSON через временный файл, чтобы читатели не видели половину"""
+    tmp_path = f"{file_path}.{socket.gethostname()}.{os.getpid()}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, file_path)
+
+
+def _read_json(file_path):
+    with open(file_path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def worker_id():
+    """Идентификатор воркера: узел и PID"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def init_queue(queue_dir):
+    """Создать структуру каталогов очереди"""
+    for state in QUEUE_STATES:
+        os.makedirs(_state_dir(queue_dir, state), exist_ok=True)
+
+
+def enqueue_directory(input_dir, output_dir, queue_dir, mode="local", params=None):
+    """Координатор: поставить в очередь все LAS/LAZ-файлы папки.
+
+    Задачи упорядочены по убыванию числа точек из заголовка, чтобы крупные
+    тайлы разбирались первыми и воркеры заканчивали примерно одновременно.
+    """
+    import laspy
+
+    init_queue(queue_dir)
+    os.makedirs(output_dir, exist_ok=True)
+
+    tiles = []
+    for filename in os.listdir(input_dir):
+        if filename.lower().endswith(".las") or filename.lower().endswith(".laz"):
+            input_file = os.path.join(input_dir, filename)
+            with laspy.open(input_file) as reader:
+                point_count = int(reader.header.point_count)
+            tiles.append((point_count, filename))
+
+    tiles.sort(key=lambda tile: (-tile[0], tile[1]))
+    for order, (point_count, filename) in enumerate(tiles):
+        job_id = f"{order:06d}_{os.path.splitext(filename)[0]}"
+        job = {
+            "id": job_id,
+            "input_file": os.path.abspath(os.path.join(input_dir, filename)),
+            "output_file": os.path.abspath(os.path.join(output_dir, filename)),
+            "header_points": point_count,
+            "mode": mode,
+            "params": params or {},
+            "attempts": 0,
+        }
+        _write_json_atomic(os.path.join(_state_dir(queue_dir, "pending"), f"{job_id}.json"), job)
+
+    print(f"Queued {len(tiles)} files into {queue_dir}")
+    return len(tiles)
+
+
+def claim_job(queue_dir):
+    """Забрать следующую задачу из очереди.
+
+    Захват - это os.rename из pending/ в leased/: из нескольких воркеров,
+    переименовывающих один файл, успех получает ровно один.
+    """
+    pending_dir = _state_dir(queue_dir, "pending")
+    leased_dir = _state_dir(queue_dir, "leased")
+    for name in sorted(os.listdir(pending_dir)):
+        if not name.endswith(".json"):
+            continue
+        pending_path = os.path.join(pending_dir, name)
+        lease_path = os.path.join(leased_dir, name)
+        try:
+            # rename сохраняет mtime: без этого долго ждавшая задача попала бы
+            # в leased/ уже просроченной и её сразу забрал бы requeue_stale
+            os.utime(pending_path)
+            os.rename(pending_path, lease_path)
+        except FileNotFoundError:
+            continue  # задачу уже забрал другой воркер
+        try:
+            job = _read_json(lease_path)
+            job["attempts"] += 1
+            job["worker"] = worker_id()
+            if not renew_lease(lease_path):
+                continue
+            _write_json_atomic(lease_path, job)
+        except FileNotFoundError:
+            continue  # аренду успели вернуть в очередь
+        return job, lease_path
+    return None, None
+
+
+def renew_lease(lease_path):
+    """Продлить аренду. False - аренда потеряна (задача возвращена в очередь)"""
+    try:
+        os.utime(lease_path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+def requeue_stale(queue_dir, lease_seconds=DEFAULT_LEASE_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """Вернуть в очередь задачи, аренда которых не продлевалась lease_seconds.
+
+    Задачи, исчерпавшие max_attempts, переносятся в failed/.
+    Часы узлов должны расходиться много меньше, чем на lease_seconds.
+    """
+    leased_dir = _state_dir(queue_dir, "leased")
+    now = time.time()
+    requeued = 0
+    for name in os.listdir(leased_dir):
+        if not name.endswith(".json"):
+            continue
+        lease_path = os.path.join(leased_dir, name)
+        try:
+            if now - os.path.getmtime(lease_path) < lease_seconds:
+                continue
+            job = _read_json(lease_path)
+        except (FileNotFoundError, json.JSONDecodeError):
+            continue
+
+        state = "failed" if job["attempts"] >= max_attempts else "pending"
+        try:
+            os.rename(lease_path, os.path.join(_state_dir(queue_dir, state), name))
+        except FileNotFoundError:
+            continue  # задачу завершили или вернули одновременно с нами
+        print(f"Lease expired for {job['id']} ({job.get('worker')}), moved to {state}")
+        requeued += 1
+    return requeued
+
+
+def _finish_job(queue_dir, lease_path, job, state, result):
+    """Записать результат и снять аренду"""
+    job = dict(job, **result)
+    _write_json_atomic(os.path.join(_state_dir(queue_dir, state), os.path.basename(lease_path)), job)
+    try:
+        os.remove(lease_path)
+    except FileNotFoundError:
+        print(f"Warning: lease for {job['id']} was lost before completion")
+
+
+def _temporary_output(output_file):
+    """Временный путь рядом с output_file (расширение сохраняется для laspy)"""
+    base, ext = os.path.splitext(output_file)
+    return f"{base}.{socket.gethostname()}.{os.getpid()}.tmp{ext}"
+
+
+def run_job(job, output_file=None):
+    """Выполнить одну задачу существующими функциями фильтрации.
+
+    output_file - куда писать результат (по умолчанию job["output_file"]).
+    """
+    params = job["params"]
+    output_file = output_file or job["output_file"]
+    if job["mode"] == "full":
+        import laspy
+
+        las = laspy.read(job["input_file"])
+        points_before = len(las)
+        las = full_filter_las(las, params.get("N_points", 5000000))
+        las.write(output_file)
+        return {"points_before": points_before, "points_after": len(las)}
+
+    counts = process_las_file(
+        job["input_file"],
+        output_file,
+        params.get("M", 100),
+        params.get("K", 10),
+        params.get("sigma_multiplier", 2),
+    )
+    if counts is None:
+        return {"points_before": job["header_points"], "points_after": None, "skipped": True}
+    return {"points_before": counts[0], "points_after": counts[1]}
+
+
+def _remove_if_exists(file_path):
+    try:
+        os.remove(file_path)
+    except FileNotFoundError:
+        pass
+
+
+def _heartbeat(lease_path, interval, stop_event, lost_event):
+    while not stop_event.wait(interval):
+        if not renew_lease(lease_path):
+            lost_event.set()
+            return
+
+
+def run_worker(queue_dir, lease_seconds=DEFAULT_LEASE_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS, wait_for_leases=True):
+    """Воркер: брать задачи, пока очередь не опустеет.
+
+    Если pending/ пуст, но в leased/ ещё есть задачи, воркер ждёт: они могут
+    завершиться или вернуться в очередь по истечении аренды.
+    """
+    init_queue(queue_dir)
+    processed = 0
+    while True:
+        requeue_stale(queue_dir, lease_seconds, max_attempts)
+        job, lease_path = claim_job(queue_dir)
+        if job is None:
+            if wait_for_leases and os.listdir(_state_dir(queue_dir, "leased")):
+                time.sleep(min(POLL_SECONDS, lease_seconds))
+                continue
+            break
+
+        print(f"[{job['worker']}] {job['id']}: attempt {job['attempts']}")
+        stop_event, lost_event = threading.Event(), threading.Event()
+        heartbeat = threading.Thread(
+            target=_heartbeat,
+            args=(lease_path, max(lease_seconds / 3, 0.1), stop_event, lost_event),
+            daemon=True,
+        )
+        heartbeat.start()
+
+        # результат пишется во временный файл и переносится на место только
+        # пока аренда за этим воркером, иначе два воркера писали бы один файл
+        temp_output = _temporary_output(job["output_file"])
+        start_time = time.time()
+        try:
+            result = run_job(job, temp_output)
+            state = "done"
+        except Exception:
+            result = {"error": traceback.format_exc()}
+            state = "failed" if job["attempts"] >= max_attempts else "pending"
+        finally:
+            stop_event.set()
+            heartbeat.join()
+        result["duration"] = round(time.time() - start_time, 3)
+
+        if lost_event.is_set() or not renew_lease(lease_path):
+            _remove_if_exists(temp_output)
+            print(f"Warning: lease for {job['id']} expired while processing, result discarded")
+            continue
+        if state == "done" and os.path.exists(temp_output):
+            os.replace(temp_output, job["output_file"])
+        else:
+            _remove_if_exists(temp_output)
+        _finish_job(queue_dir, lease_path, job, state, result)
+        processed += 1
+
+    print(f"[{worker_id()}] queue is empty, processed {processed} jobs")
+    return processed
+
+
+def run_local_workers(queue_dir, n_workers=None, lease_seconds=DEFAULT_LEASE_SECONDS, max_attempts=DEFAULT_MAX_ATTEMPTS):
+    """Запустить n_workers воркеров на этой машине и дождаться их завершения"""
+    n_workers = n_workers or os.cpu_count() or 1
+    workers = [
+        multiprocessing.Process(target=run_worker, args=(queue_dir, lease_seconds, max_attempts))
+        for _ in range(n_workers)
+    ]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    return queue_status(queue_dir)
+
+
+def queue_status(queue_dir):
+    """Число задач в каждом состоянии"""
+    return {state: len([n for n in os.listdir(_state_dir(queue_dir, state)) if n.endswith(".json")])
+            for state in QUEUE_STATES}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Distributed LAS cleaning with a file-based job queue")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    enqueue = subparsers.add_parser("coordinator", help="enqueue all LAS/LAZ files of a directory")
+    enqueue.add_argument("input_dir")
+    enqueue.add_argument("output_dir")
+    enqueue.add_argument("queue_dir")
+    enqueue.add_argument("--mode", choices=["local", "full"], default="local")
+    enqueue.add_argument("--M", type=int, default=100)
+    enqueue.add_argument("--K", type=int, default=10)
+    enqueue.add_argument("--sigma-multiplier", type=float, default=2)
+    enqueue.add_argument("--n-points", type=int, default=5000000)
+
+    worker = subparsers.add_parser("worker", help="process jobs until the queue is empty")
+    worker.add_argument("queue_dir")
+    worker.add_argument("--processes", type=int, default=1)
+    worker.add_argument("--lease-seconds", type=float, default=DEFAULT_LEASE_SECONDS)
+    worker.add_argument("--max-attempts", type=int, default=DEFAULT_MAX_ATTEMPTS)
+
+    status = subparsers.add_parser("status", help="show job counts")
+    status.add_argument("queue_dir")
+
+    args = parser.parse_args(argv)
+    if args.command == "coordinator":
+        params = {"M": args.M, "K": args.K, "sigma_multiplier": args.sigma_multiplier, "N_points": args.n_points}
+        enqueue_directory(args.input_dir, args.output_dir, args.queue_dir, args.mode, params)
+    elif args.command == "worker":
+        if args.processes > 1:
+            run_local_workers(args.queue_dir, args.processes, args.lease_seconds, args.max_attempts)
+        else:
+            run_worker(args.queue_dir, args.lease_seconds, args.max_attempts)
+    print(queue_status(args.queue_dir))
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+"""Бюджет времени импорта для GUI и local_filter.
+
+Для каждого модуля запускается отдельный интерпретатор с -X importtime,
+из отчёта берётся суммарное время импорта модуля и список загруженных
+тяжёлых зависимостей. Скрипт завершается с кодом 1, если бюджет превышен
+или модуль при импорте тянет то, что должно загружаться лениво.
+
+    python benchmarks/import_time.py [--repeat 5] [--allow-missing]
+
+Модуль, который не удаётся импортировать (например, нет PyQt6), считается
+провалом проверки; --allow-missing разрешает пропустить такие модули.
+"""
+import os
+import sys
+import argparse
+import subprocess
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# модуль -> (бюджет в мс, модули, которые не должны загружаться при импорте)
+IMPORT_BUDGETS = {
+    "local_filter": (250, ("laspy", "scipy")),
+    "main_tk": (150, ("numpy", "laspy", "scipy")),
+    "main": (400, ("numpy", "laspy", "scipy")),
+    "main_en": (400, ("numpy", "laspy", "scipy")),
+}
+
+# Безголовый запуск downsample_las и apply_zor не должен загружать scipy
+HEADLESS_CHECK = """
+import sys
+import numpy as np
+import laspy
+import local_filter
+
+header = laspy.LasHeader(point_format=3, version="1.2")
+las = laspy.LasData(header)
+rng = np.random.default_rng(0)
+las.x, las.y, las.z = rng.uniform(0, 100, (3, 10000))
+las = local_filter.downsample_las(las, 5000)
+las = local_filter.apply_zor(las)
+print(",".join(m for m in ("scipy", "scipy.spatial", "scipy.interpolate") if m in sys.modules))
+"""
+
+
+def measure_import(module, forbidden):
+    """Время импорта модуля (мс) и загруженные запрещённые зависимости"""
+    code = (
+        f"import sys; import {module}; "
+        f"print(','.join(m for m in {forbidden!r} if m in sys.modules))"
+    )
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", code],
+        cwd=REPO_DIR, capture_output=True, text=True,
+    )
+    if result.returncode != 0:
+        return None, result.stderr.strip().splitlines()[-1]
+
+    cumulative_us = None
+    for line in result.stderr.splitlines():
+        parts = [part.strip() for part in line.split("|")]
+        if len(parts) == 3 and parts[2] == module:
+            cumulative_us = int(parts[1])
+    loaded = [name for name in result.stdout.strip().split(",") if name]
+    return cumulative_us / 1000, loaded
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check the import-time budget of the GUIs and local_filter")
+    parser.add_argument("--repeat", type=int, default=3, help="take the best of N runs")
+    parser.add_argument("--allow-missing", action="store_true",
+                        help="skip modules whose dependencies are not installed instead of failing")
+    args = parser.parse_args(argv)
+
+    failed = False
+    print(f"{'module':<14} {'best ms':>9} {'budget ms':>10}  eagerly loaded")
+    for module, (budget_ms, forbidden) in IMPORT_BUDGETS.items():
+        runs = [measure_import(module, forbidden) for _ in range(args.repeat)]
+        if runs[0][0] is None:
+            status = "skipped" if args.allow_missing else "FAIL"
+            failed |= not args.allow_missing
+            print(f"{module:<14} {'-':>9} {budget_ms:>10}  {status}: {runs[0][1]}")
+            continue
+        best_ms = min(ms for ms, _ in runs)
+        loaded = runs[0][1]
+        over = best_ms > budget_ms or bool(loaded)
+        failed |= over
+        print(f"{module:<14} {best_ms:>9.1f} {budget_ms:>10}  {', '.join(loaded) or '-'}{'  FAIL' if over else ''}")
+
+    result = subprocess.run([sys.executable, "-c", HEADLESS_CHECK], cwd=REPO_DIR, capture_output=True, text=True)
+    if result.returncode != 0:
+        status = "skipped" if args.allow_missing else "FAIL"
+        failed |= not args.allow_missing
+        print(f"headless downsample_las/apply_zor: {status}: {result.stderr.strip().splitlines()[-1]}")
+    else:
+        loaded = result.stdout.strip()
+        failed |= bool(loaded)
+        print(f"headless downsample_las/apply_zor: scipy loaded: {loaded or '-'}{'  FAIL' if loaded else ''}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
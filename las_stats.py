@@ -0,0 +1,171 @@
+"""Потоковая статистика по LAS-файлам для таблицы анализа.
+
+Файл читается один раз блоками через laspy.open().chunk_iterator, поэтому
+подходит и для файлов, которые не помещаются в память целиком.
+"""
+import os
+import numpy as np
+
+DEFAULT_CHUNK_SIZE = 1_000_000
+DEFAULT_PERCENTILES = (5, 50, 95)
+HISTOGRAM_BINS = 4096
+
+_stats_cache = {}
+
+
+class RunningStats:
+    """Среднее и дисперсия по Уэлфорду с объединением блоков (Chan et al.)"""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = np.inf
+        self.max = -np.inf
+
+    def update(self, values):
+        n = len(values)
+        if n == 0:
+            return
+        values = np.asarray(values, dtype=np.float64)
+        block_mean = values.mean()
+        block_m2 = np.square(values - block_mean).sum()
+        self.merge(n, block_mean, block_m2)
+        self.min = min(self.min, values.min())
+        self.max = max(self.max, values.max())
+
+    def merge(self, n, block_mean, block_m2):
+        """Добавить готовые (count, mean, M2) другого блока"""
+        if n == 0:
+            return
+        total = self.count + n
+        delta = block_mean - self.mean
+        self.mean += delta * n / total
+        self.m2 += block_m2 + delta * delta * self.count * n / total
+        self.count = total
+
+    @property
+    def variance(self):
+        return self.m2 / self.count if self.count else np.nan
+
+    @property
+    def std(self):
+        return np.sqrt(self.variance)
+
+
+def histogram_quantiles(counts, edges, percentiles):
+    """Перцентили по гистограмме с линейной интерполяцией внутри корзины"""
+    cumulative = np.cumsum(counts)
+    total = cumulative[-1]
+    if total == 0:
+        return [np.nan] * len(percentiles)
+    result = []
+    for p in percentiles:
+        target = total * p / 100
+        i = min(int(np.searchsorted(cumulative, target)), len(counts) - 1)
+        before = cumulative[i - 1] if i > 0 else 0
+        fraction = (target - before) / counts[i] if counts[i] else 0.0
+        result.append(edges[i] + fraction * (edges[i + 1] - edges[i]))
+    return result
+
+
+def histogram_outlier_fraction(counts, edges, mean, std, z_sigma_threshold=3):
+    """Доля точек вне mean ± z_sigma_threshold * std (оценка по центрам корзин)"""
+    total = counts.sum()
+    if total == 0 or not np.isfinite(std):
+        return np.nan
+    centers = (edges[:-1] + edges[1:]) / 2
+    outside = np.abs(centers - mean) > z_sigma_threshold * std
+    return counts[outside].sum() / total
+
+
+def compute_file_stats(file_path, chunk_size=DEFAULT_CHUNK_SIZE, percentiles=DEFAULT_PERCENTILES,
+                       bins=HISTOGRAM_BINS, z_sigma_threshold=3):
+    """Собрать статистику по файлу за один проход блоками"""
+    import laspy
+
+    with laspy.open(file_path) as reader:
+        header = reader.header
+        dimensions = set(header.point_format.dimension_names)
+        has_rgb = {"red", "green", "blue"} <= dimensions
+
+        z_edges = np.linspace(header.mins[2], header.maxs[2], bins + 1)
+        if z_edges[-1] <= z_edges[0]:
+            z_edges = np.linspace(header.mins[2] - 0.5, header.mins[2] + 0.5, bins + 1)
+        z_counts = np.zeros(bins, dtype=np.int64)
+
+        xs, ys, zs = RunningStats(), RunningStats(), RunningStats()
+        intensity = RunningStats()
+        rgb = [RunningStats() for _ in range(3)] if has_rgb else []
+        class_counts = np.zeros(256, dtype=np.int64)
+
+        for chunk in reader.chunk_iterator(chunk_size):
+            x, y, z = np.asarray(chunk.x), np.asarray(chunk.y), np.asarray(chunk.z)
+            xs.update(x)
+            ys.update(y)
+            zs.update(z)
+            # значения за пределами диапазона из заголовка попадают в крайние корзины
+            z_counts += np.histogram(np.clip(z, z_edges[0], z_edges[-1]), bins=z_edges)[0]
+            intensity.update(chunk.intensity)
+            class_counts += np.bincount(np.asarray(chunk.classification), minlength=256)[:256]
+            for stats, name in zip(rgb, ("red", "green", "blue")):
+                stats.update(chunk[name])
+
+    dx, dy, dz = xs.max - xs.min, ys.max - ys.min, zs.max - zs.min
+    area = dx * dy
+    classes = {int(c): int(n) for c, n in enumerate(class_counts) if n}
+
+    return {
+        "points": zs.count,
+        "dx": dx,
+        "dy": dy,
+        "dz": dz,
+        "dr": rgb[0].max - rgb[0].min if has_rgb else None,
+        "dg": rgb[1].max - rgb[1].min if has_rgb else None,
+        "db": rgb[2].max - rgb[2].min if has_rgb else None,
+        "z_mean": zs.mean,
+        "z_std": zs.std,
+        "z_percentiles": dict(zip(percentiles, histogram_quantiles(z_counts, z_edges, percentiles))),
+        "density": zs.count / area if area > 0 else np.nan,
+        "intensity_mean": intensity.mean,
+        "intensity_std": intensity.std,
+        "classes": classes,
+        "outlier_fraction": histogram_outlier_fraction(z_counts, z_edges, zs.mean, zs.std, z_sigma_threshold),
+    }
+
+
+def cached_file_stats(file_path, **kwargs):
+    """compute_file_stats с кэшем по пути, размеру и времени изменения файла"""
+    stat = os.stat(file_path)
+    key = (os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns, tuple(sorted(kwargs.items())))
+    if key not in _stats_cache:
+        _stats_cache[key] = compute_file_stats(file_path, **kwargs)
+    return _stats_cache[key]
+
+
+def format_classes(classes, limit=5):
+    """Краткая строка гистограммы классов: самые частые классы с долями"""
+    total = sum(classes.values())
+    if not total:
+        return ""
+    top = sorted(classes.items(), key=lambda item: -item[1])[:limit]
+    return " ".join(f"{c}:{n / total:.0%}" for c, n in top)
+
+
+def format_stats_row(stats, percentiles=DEFAULT_PERCENTILES):
+    """Строки для таблицы файлов: точки, dx..db, затем перцентили Z,
+    плотность, интенсивность, доля выбросов и классы"""
+    def fmt(value):
+        return "" if value is None else f"{value:.2f}"
+
+    row = [str(stats["points"])]
+    row += [fmt(stats[key]) for key in ("dx", "dy", "dz", "dr", "dg", "db")]
+    row += [fmt(stats["z_percentiles"][p]) for p in percentiles]
+    row += [
+        fmt(stats["density"]),
+        fmt(stats["intensity_mean"]),
+        fmt(stats["intensity_std"]),
+        f"{stats['outlier_fraction']:.2%}",
+        format_classes(stats["classes"]),
+    ]
+    return row
@@ -1,19 +1,45 @@
 import os
+import threading
 import numpy as np
-import laspy
-from scipy.spatial import cKDTree
-from scipy.interpolate import LinearNDInterpolator
+from las_stats import RunningStats
+
+# laspy и scipy импортируются в функциях, которым они нужны: downsample_las
+# и apply_zor работают с уже прочитанным las и не должны платить за загрузку
+# scipy.spatial / scipy.interpolate (см. benchmarks/import_time.py)
+
+RESIDUAL_BLOCK_SIZE = 65536
+
+# Классы ASPRS для фильтрации с учётом классификации
+NOISE_CLASSES = (7, 18)  # низкий и высокий шум
+GROUND_CLASSES = (2,)
+FILTER_CLASSES = (0, 1)  # не классифицированные - только их проверяем по невязке
+NOISE_CLASS = 7
+
+_scratch = threading.local()
 
 def load_las_points(file_path):
     """Загрузить точки из LAS-файла"""
+    import laspy
+
     las = laspy.read(file_path)
     points = np.vstack((las.x, las.y, las.z)).T
     return points, las.header, las
 
-def save_las_points(file_path, las, mask):
-    """Сохранить отфильтрованные точки в новый LAS-файл"""
+def save_las_points(file_path, las, mask, spatial_sort=False, tile_size=None, max_points=None):
+    """Сохранить отфильтрованные точки в новый LAS-файл.
+
+    spatial_sort=True упорядочивает точки вдоль кривой Мортона; tile_size
+    и/или max_points режут результат на пространственные части (retile.py).
+    """
     filtered_points = las.points[mask]
     las.points = filtered_points
+    if tile_size or max_points:
+        from retile import write_tiles
+        write_tiles(las, file_path, tile_size, max_points)
+        return
+    if spatial_sort:
+        from retile import sort_las_spatially
+        sort_las_spatially(las)
     las.write(file_path)
 
 def calculate_grid_bounds(points):
@@ -32,6 +58,8 @@ def generate_grid(xmin, xmax, ymin, ymax, M):
 
 def compute_mean_heights(grid_points, original_points, K):
     """Найти K ближайших точек для каждого узла сетки и усреднить"""
+    from scipy.spatial import cKDTree
+
     tree = cKDTree(original_points[:, :2])
     distances, indices = tree.query(grid_points, k=K)
     z_means = np.mean(original_points[indices, 2], axis=1)
@@ -39,6 +67,8 @@ def compute_mean_heights(grid_points, original_points, K):
 
 def interpolate_surface(grid_points, z_means):
     """Построить линейную интерполяцию"""
+    from scipy.interpolate import LinearNDInterpolator
+
     interpolator = LinearNDInterpolator(grid_points, z_means)
     return interpolator
 
@@ -49,6 +79,61 @@ def filter_points(points, z_pred, sigma_multiplier=2):
     mask = residuals <= (sigma_multiplier * sigma)
     return mask
 
+def _residual_scratch(block_size):
+    """Буферы блока, общие для всех блоков и файлов в этом потоке"""
+    buffers = getattr(_scratch, "buffers", None)
+    if buffers is None or len(buffers["z"]) < block_size:
+        buffers = _scratch.buffers = {
+            "xy": np.empty((block_size, 2)),
+            "z": np.empty(block_size),
+            "tmp": np.empty(block_size),
+            "nan": np.empty(block_size, dtype=bool),
+        }
+    return buffers
+
+def blocked_residuals(x, y, z, interpolator, out, block_size=RESIDUAL_BLOCK_SIZE):
+    """Невязки |z - z_pred| блоками с накоплением статистики для σ.
+
+    Для каждого блока за один проход считаются предсказание поверхности,
+    fallback для NaN (невязка 0, как при z_pred = z) и невязка, которая
+    пишется в out. Временная память - несколько массивов размера блока.
+    Возвращает (RunningStats невязок, число точек с валидным z_pred).
+    """
+    buffers = _residual_scratch(block_size)
+    stats = RunningStats()
+    n_valid = 0
+    for start in range(0, len(out), block_size):
+        end = min(start + block_size, len(out))
+        m = end - start
+        xy, zb, tmp, nan = buffers["xy"][:m], buffers["z"][:m], buffers["tmp"][:m], buffers["nan"][:m]
+        xy[:, 0] = x[start:end]
+        xy[:, 1] = y[start:end]
+        zb[:] = z[start:end]
+
+        residual = out[start:end]
+        residual[:] = interpolator(xy)
+        np.isnan(residual, out=nan)
+        n_valid += m - np.count_nonzero(nan)
+        np.subtract(zb, residual, out=residual)
+        np.abs(residual, out=residual)
+        residual[nan] = 0  # fallback на оригинальные z
+
+        block_mean = residual.mean()
+        np.subtract(residual, block_mean, out=tmp)
+        np.square(tmp, out=tmp)
+        stats.merge(m, block_mean, tmp.sum())
+    return stats, n_valid
+
+def residual_filter_mask(x, y, z, interpolator, sigma_multiplier=2, block_size=RESIDUAL_BLOCK_SIZE):
+    """Маска |z - z_pred| <= sigma_multiplier * σ через blocked_residuals.
+
+    Возвращает (маска, число точек с валидным z_pred).
+    """
+    residuals = np.empty(len(z))
+    stats, n_valid = blocked_residuals(x, y, z, interpolator, residuals, block_size)
+    mask = residuals <= sigma_multiplier * stats.std
+    return mask, n_valid
+
 def downsample_las(las, points_limit):
     selected_indices = np.random.choice(len(las), points_limit, replace=False)
     las.points = las.points[selected_indices]
@@ -71,23 +156,156 @@ def apply_zor(las, threshold=0.1, z_sigma_threshold=3):
         outlets_count = original_count - len(valid_indices)
     return las
 
-def local_filter_las(las, M=100, K=10, sigma_multiplier=2):
+def surface_envelopes(z_means, M, coarse_factor):
+    """Мин/макс поверхности по ячейкам сетки и по блокам coarse_factor x coarse_factor ячеек.
+
+    Линейная интерполяция по треугольникам регулярной сетки внутри ячейки не
+    выходит за пределы значений в её четырёх углах, поэтому эти огибающие
+    ограничивают z_pred для любой точки ячейки или блока.
+    """
+    z_grid = z_means.reshape(M, M)
+    corners = (z_grid[:-1, :-1], z_grid[:-1, 1:], z_grid[1:, :-1], z_grid[1:, 1:])
+    cell_min = np.minimum.reduce(corners)
+    cell_max = np.maximum.reduce(corners)
+
+    n_blocks = -(-(M - 1) // coarse_factor)
+    pad = n_blocks * coarse_factor - (M - 1)
+    block_min = np.pad(cell_min, ((0, pad), (0, pad)), constant_values=np.inf)
+    block_max = np.pad(cell_max, ((0, pad), (0, pad)), constant_values=-np.inf)
+    block_min = block_min.reshape(n_blocks, coarse_factor, n_blocks, coarse_factor).min(axis=(1, 3))
+    block_max = block_max.reshape(n_blocks, coarse_factor, n_blocks, coarse_factor).max(axis=(1, 3))
+    return cell_min, cell_max, block_min, block_max
+
+def classify_by_envelope(z, surface_min, surface_max, threshold):
+    """Грубая проверка: True/False - точно inlier/outlier, ambiguous - нужен точный z_pred"""
+    residual_min = np.maximum(np.maximum(surface_min - z, z - surface_max), 0)
+    residual_max = np.maximum(z - surface_min, surface_max - z)
+    inlier = residual_max <= threshold
+    ambiguous = ~inlier & (residual_min <= threshold)
+    return inlier, ambiguous
+
+def progressive_filter_mask(points, grid_bounds, z_means, interpolator, M, sigma_multiplier=2,
+                            coarse_factor=8, sigma_sample=200000):
+    """Фильтр от грубого к точному.
+
+    σ невязок оценивается по случайной выборке из sigma_sample точек, затем
+    точки отсеиваются по огибающим блоков и ячеек сетки, а интерполятор
+    вызывается только для точек в неоднозначной полосе около порога.
+    """
+    xmin, xmax, ymin, ymax = grid_bounds
+    n_points = len(points)
+
+    sample = np.random.choice(n_points, min(sigma_sample, n_points), replace=False)
+    z_sample = interpolator(points[sample, 0], points[sample, 1])
+    residuals_sample = np.abs(points[sample, 2] - z_sample)
+    residuals_sample[np.isnan(residuals_sample)] = 0  # fallback на оригинальные z
+    threshold = sigma_multiplier * np.std(residuals_sample)
+    # запас на ошибки округления в огибающих
+    tolerance = 1e-9 * max(1.0, np.abs(z_means).max())
+
+    cell_min, cell_max, block_min, block_max = surface_envelopes(z_means, M, coarse_factor)
+    step_x = (xmax - xmin) / (M - 1) if xmax > xmin else 1.0
+    step_y = (ymax - ymin) / (M - 1) if ymax > ymin else 1.0
+    cell_i = np.clip(((points[:, 0] - xmin) / step_x).astype(np.intp), 0, M - 2)
+    cell_j = np.clip(((points[:, 1] - ymin) / step_y).astype(np.intp), 0, M - 2)
+
+    z = points[:, 2]
+    mask, ambiguous = classify_by_envelope(
+        z,
+        block_min[cell_j // coarse_factor, cell_i // coarse_factor] - tolerance,
+        block_max[cell_j // coarse_factor, cell_i // coarse_factor] + tolerance,
+        threshold,
+    )
+
+    idx = np.flatnonzero(ambiguous)
+    inlier, ambiguous = classify_by_envelope(
+        z[idx],
+        cell_min[cell_j[idx], cell_i[idx]] - tolerance,
+        cell_max[cell_j[idx], cell_i[idx]] + tolerance,
+        threshold,
+    )
+    mask[idx[inlier]] = True
+
+    idx = idx[ambiguous]
+    z_pred = interpolator(points[idx, 0], points[idx, 1])
+    residuals = np.abs(z[idx] - z_pred)
+    mask[idx] = np.isnan(residuals) | (residuals <= threshold)
+    return mask
+
+def drop_noise_points(las, noise_classes=NOISE_CLASSES):
+    """Удалить точки, уже помеченные как шум"""
+    keep = ~np.isin(np.asarray(las.classification), noise_classes)
+    if not np.all(keep):
+        las.points = las.points[keep]
+    return las
+
+def local_filter_las(las, M=100, K=10, sigma_multiplier=2, progressive=False, coarse_factor=8, sigma_sample=200000,
+                     use_classification=False, mark_noise=False, workers=1):
+    """Локальная фильтрация по отклонению от сглаженной поверхности.
+
+    progressive=True включает проверку от грубого к точному
+    (progressive_filter_mask): σ оценивается по выборке, зато интерполяция
+    считается только для пограничных точек.
+
+    use_classification=True учитывает классы ASPRS: шум (NOISE_CLASSES)
+    отбрасывается сразу, поверхность строится по земле (GROUND_CLASSES,
+    если таких точек не меньше K), а по невязке проверяются только
+    FILTER_CLASSES. mark_noise=True не удаляет отбракованные точки, а
+    присваивает им класс NOISE_CLASS.
+
+    workers > 1 распределяет обработку тайла по процессам через общую
+    память (parallel_filter.py); используется без progressive и
+    use_classification.
+    """
+    if workers > 1 and not progressive and not use_classification:
+        from parallel_filter import parallel_local_filter_las
+        return parallel_local_filter_las(las, M, K, sigma_multiplier, workers, mark_noise)
+
+    if use_classification and not mark_noise:
+        las = drop_noise_points(las)
 
     points = np.vstack((las.x, las.y, las.z)).T
-    xmin, xmax, ymin, ymax = calculate_grid_bounds(points)
+    if use_classification:
+        classes = np.asarray(las.classification)
+        noise = np.isin(classes, NOISE_CLASSES)
+        candidates = np.isin(classes, FILTER_CLASSES)
+        reference = np.isin(classes, GROUND_CLASSES)
+        if np.count_nonzero(reference) < K:
+            reference = ~noise
+        grid_source = points[~noise] if np.any(noise) else points
+    else:
+        candidates = reference = None
+        grid_source = points
+
+    xmin, xmax, ymin, ymax = calculate_grid_bounds(grid_source)
     grid_points = generate_grid(xmin, xmax, ymin, ymax, M)
-    z_means = compute_mean_heights(grid_points, points, K)
+    z_means = compute_mean_heights(grid_points, points if reference is None else points[reference], K)
     interpolator = interpolate_surface(grid_points, z_means)
 
-    z_pred = interpolator(points[:, 0], points[:, 1])
+    tested = points if candidates is None else points[candidates]
+    if progressive and len(tested) > sigma_sample:
+        mask = progressive_filter_mask(tested, (xmin, xmax, ymin, ymax), z_means, interpolator, M,
+                                       sigma_multiplier, coarse_factor, sigma_sample)
+    else:
+        mask, _ = residual_filter_mask(tested[:, 0], tested[:, 1], tested[:, 2], interpolator, sigma_multiplier)
 
-    z_pred[np.isnan(z_pred)] = points[np.isnan(z_pred), 2]  # fallback на оригинальные z
+    if candidates is not None:
+        keep = np.ones(len(points), dtype=bool)
+        keep[candidates] = mask
+        mask = keep
 
-    mask = filter_points(points, z_pred, sigma_multiplier)
-    las.points = las.points[mask]
+    if mark_noise:
+        classification = np.array(las.classification)
+        classification[~mask] = NOISE_CLASS
+        las.classification = classification
+    else:
+        las.points = las.points[mask]
     return las
 
-def full_filter_las(las, N_points):
+def full_filter_las(las, N_points, use_classification=False):
+    if use_classification:
+        las = drop_noise_points(las)
+
     if len(las)>2*N_points:
         las = downsample_las(las, 2*N_points)
         print('1st Downsapling...')
@@ -95,7 +313,7 @@ def full_filter_las(las, N_points):
     print(f'Global filtering')
     las = apply_zor(las, threshold=0.1, z_sigma_threshold=3)
     print(f'Local filtering')
-    las = local_filter_las(las, M=100, K=10, sigma_multiplier=2)
+    las = local_filter_las(las, M=100, K=10, sigma_multiplier=2, use_classification=use_classification)
     
     if len(las)>N_points:
         las = downsample_las(las, N_points)
@@ -103,39 +321,85 @@ def full_filter_las(las, N_points):
 
     return las
 
-def process_las_file(input_file, output_file, M=100, K=10, sigma_multiplier=2):
-    """Основная функция обработки одного файла"""
-    print(f"Processing {input_file}...")
-
-    points, header, las = load_las_points(input_file)
+def compute_filter_mask(points, M=100, K=10, sigma_multiplier=2):
+    """Маска точек, оставляемых локальным фильтром (None - интерполяция не удалась)"""
     xmin, xmax, ymin, ymax = calculate_grid_bounds(points)
     grid_points = generate_grid(xmin, xmax, ymin, ymax, M)
     z_means = compute_mean_heights(grid_points, points, K)
     interpolator = interpolate_surface(grid_points, z_means)
 
-    z_pred = interpolator(points[:, 0], points[:, 1])
-    valid_pred = ~np.isnan(z_pred)
-    
-    if not np.any(valid_pred):
-        print(f"Warning: no valid interpolation for {input_file}. Skipping.")
-        return
+    mask, n_valid = residual_filter_mask(points[:, 0], points[:, 1], points[:, 2], interpolator, sigma_multiplier)
+
+    if n_valid == 0:
+        return None
+
+    return mask
+
+def process_las_file(input_file, output_file, M=100, K=10, sigma_multiplier=2, save_options=None):
+    """Основная функция обработки одного файла.
+
+    save_options - дополнительные параметры save_las_points
+    (spatial_sort, tile_size, max_points).
+    """
+    print(f"Processing {input_file}...")
 
-    z_pred[np.isnan(z_pred)] = points[np.isnan(z_pred), 2]  # fallback на оригинальные z
+    points, header, las = load_las_points(input_file)
+    mask = compute_filter_mask(points, M, K, sigma_multiplier)
+
+    if mask is None:
+        print(f"Warning: no valid interpolation for {input_file}. Skipping.")
+        return None
 
-    mask = filter_points(points, z_pred, sigma_multiplier)
     print(f"Points before: {len(points)}, after filtering: {np.sum(mask)}")
 
-    save_las_points(output_file, las, mask)
+    save_las_points(output_file, las, mask, **(save_options or {}))
     print(f"Saved cleaned file to {output_file}")
+    return len(points), int(np.sum(mask))
+
+def process_directory(input_dir, output_dir, M=100, K=10, sigma_multiplier=2, pipelined=True, prefetch=2,
+                      save_options=None):
+    """Обработать все LAS-файлы в папке.
 
-def process_directory(input_dir, output_dir, M=100, K=10, sigma_multiplier=2):
-    """Обработать все LAS-файлы в папке"""
+    При pipelined=True чтение следующих файлов и запись уже обработанных
+    идут в фоне параллельно с фильтрацией текущего (см. pipeline.py).
+    """
     os.makedirs(output_dir, exist_ok=True)
+    jobs = []
     for filename in os.listdir(input_dir):
         if filename.lower().endswith(".las") or filename.lower().endswith(".laz"):
             input_file = os.path.join(input_dir, filename)
             output_file = os.path.join(output_dir, filename)
-            process_las_file(input_file, output_file, M, K, sigma_multiplier)
+            jobs.append((input_file, output_file))
+
+    if not pipelined:
+        for input_file, output_file in jobs:
+            process_las_file(input_file, output_file, M, K, sigma_multiplier, save_options)
+        return
+
+    from pipeline import run_pipeline
+
+    def read(job):
+        return load_las_points(job[0])
+
+    def process(job, data):
+        points, header, las = data
+        print(f"Processing {job[0]}...")
+        mask = compute_filter_mask(points, M, K, sigma_multiplier)
+        if mask is None:
+            print(f"Warning: no valid interpolation for {job[0]}. Skipping.")
+            return None
+        print(f"Points before: {len(points)}, after filtering: {np.sum(mask)}")
+        return las, mask
+
+    def write(job, result):
+        if result is None:
+            return None
+        las, mask = result
+        save_las_points(job[1], las, mask, **(save_options or {}))
+        print(f"Saved cleaned file to {job[1]}")
+        return len(mask), int(np.sum(mask))
+
+    run_pipeline(jobs, read, process, write, prefetch=prefetch, write_behind=prefetch)
 
 if __name__ == "__main__":
     # 👉 Здесь задаются пути и параметры
@@ -1,11 +1,14 @@
 import sys
 import os
-import laspy
-import numpy as np
 from PyQt6.QtWidgets import QApplication, QWidget, QPushButton, QFileDialog, QLabel, QVBoxLayout, QTableWidget, QTableWidgetItem, QProgressBar, QComboBox, QLineEdit
 from datetime import datetime
+# laspy, numpy и модули обработки импортируются в методах, чтобы окно
+# появлялось сразу, не дожидаясь их загрузки
 #from scipy.spatial import KDTree
 
+# Колонки таблицы файлов, заполняемые по format_stats_row (8 - "Удалено точек")
+STATS_TABLE_COLUMNS = list(range(1, 8)) + list(range(9, 17))
+
 class LasAnalyzerApp(QWidget):
     def __init__(self):
         super().__init__()
@@ -25,9 +28,10 @@ class LasAnalyzerApp(QWidget):
         self.btn_select_save_dir = QPushButton("Выбрать каталог для сохранения", self)
 
         self.table_files = QTableWidget(self)
-        self.table_files.setColumnCount(9)
+        self.table_files.setColumnCount(17)
         self.table_files.setHorizontalHeaderLabels(
-            ["Файл", "Точек", "dx", "dy", "dz", "dr", "dg", "db", "Удалено точек"]
+            ["Файл", "Точек", "dx", "dy", "dz", "dr", "dg", "db", "Удалено точек",
+             "Z p5", "Z p50", "Z p95", "Плотность, т/м²", "Интенсивность ср.", "Интенсивность σ", "Выбросы Z", "Классы"]
         )
 
         self.table_stats = QTableWidget(self)
@@ -104,6 +108,9 @@ class LasAnalyzerApp(QWidget):
             self.save_path_label.setText(f"Путь для сохранения: {directory}")
 
     def analyze_files(self):
+        import numpy as np
+        from las_stats import cached_file_stats, format_stats_row
+
         if not self.las_files:
             self.table_files.setRowCount(0)
             return
@@ -114,48 +121,25 @@ class LasAnalyzerApp(QWidget):
         self.label_end_time.setText("")
         self.label_total_time.setText("")
 
-        total_points = []
-        dx_list, dy_list, dz_list = [], [], []
-        dr_list, dg_list, db_list = [], [], []
-
         total_files = len(self.las_files)
-
         self.progress_bar.setRange(0, total_files)
 
         start_time = datetime.now()
 
+        all_stats = []
         for i, file in enumerate(self.las_files):
-            las = laspy.read(file)
-
-            # Геометрические параметры
-            dx, dy, dz = las.x.max() - las.x.min(), las.y.max() - las.y.min(), las.z.max() - las.z.min()
-            dx_list.append(dx)
-            dy_list.append(dy)
-            dz_list.append(dz)
-
-            # Цветовые параметры
-            if hasattr(las, 'red') and hasattr(las, 'green') and hasattr(las, 'blue'):
-                dr = las.red.max() - las.red.min()
-                dg = las.green.max() - las.green.min()
-                db = las.blue.max() - las.blue.min()
-                dr_list.append(dr)
-                dg_list.append(dg)
-                db_list.append(db)
-
-            total_points.append(len(las.points))
-
-            self.table_files.setItem(i, 1, QTableWidgetItem(str(total_points[-1])))
-            self.table_files.setItem(i, 2, QTableWidgetItem(f"{dx:.2f}"))
-            self.table_files.setItem(i, 3, QTableWidgetItem(f"{dy:.2f}"))
-            self.table_files.setItem(i, 4, QTableWidgetItem(f"{dz:.2f}"))
-            if dr_list:
-                self.table_files.setItem(i, 5, QTableWidgetItem(f"{dr:.2f}"))
-                self.table_files.setItem(i, 6, QTableWidgetItem(f"{dg:.2f}"))
-                self.table_files.setItem(i, 7, QTableWidgetItem(f"{db:.2f}"))
-
+            all_stats.append(cached_file_stats(file))
             self.progress_bar.setValue(i + 1)
             self.label_processing.setText(f"Обрабатывается: {i + 1} из {total_files} файлов ({self.files_names[i]})")
 
+        # Заполняем таблицу целиком, без перерисовки после каждой ячейки
+        self.table_files.setUpdatesEnabled(False)
+        for i, stats in enumerate(all_stats):
+            for column, text in zip(STATS_TABLE_COLUMNS, format_stats_row(stats)):
+                self.table_files.setItem(i, column, QTableWidgetItem(text))
+        self.table_files.setUpdatesEnabled(True)
+
+        total_points = [stats["points"] for stats in all_stats]
         if total_points:
             avg_points = np.mean(total_points)
             min_points, max_points = min(total_points), max(total_points)
@@ -174,6 +158,10 @@ class LasAnalyzerApp(QWidget):
         self.label_total_time.setText(f"Время обработки: {str(processing_duration)} секунд")
 
     def start_cleaning(self):
+        import laspy
+        import numpy as np
+        from pipeline import run_pipeline
+
         if not self.las_files or not self.save_directory:
             return
 
@@ -192,24 +180,39 @@ class LasAnalyzerApp(QWidget):
 
         start_time = datetime.now()
 
-        for i, file in enumerate(self.las_files):
-            las = laspy.read(file)
+        # Чтение следующих файлов и запись обработанных идут в фоне (pipeline.py)
+        def read(job):
+            return laspy.read(job[1])
 
+        def process(job, las):
             # Ограничение количества точек
             if len(las.points) > points_limit:
                 selected_indices = np.random.choice(len(las.points), points_limit, replace=False)
                 las.points = las.points[selected_indices]
 
             if algorithm == "ZOR":
-                name = os.path.basename(file)  # Имя файла
+                name = os.path.basename(job[1])
                 print(name)
-                original_point_count = len(las.points)
-                removed_points = self.apply_zor(las, name)
+                return las, self.apply_zor(las, name)
+            return None
+
+        def write(job, result):
+            if result is None:
+                return None
+            las, removed_points = result
+            self.save_filtered(las, os.path.basename(job[1]))
+            return removed_points
+
+        def done(job, removed_points):
+            i, file = job
+            if removed_points is not None:
                 self.table_files.setItem(i, 8, QTableWidgetItem(str(removed_points)))
 
             self.progress_bar.setValue(i + 1)
             self.label_processing.setText(f"Обрабатывается: {i + 1} из {total_files} файлов ({self.files_names[i]})")
 
+        run_pipeline(enumerate(self.las_files), read, process, write, on_done=done)
+
         end_time = datetime.now()
         processing_duration = end_time - start_time
 
@@ -220,6 +223,8 @@ class LasAnalyzerApp(QWidget):
         self.label_total_time.setText(f"Время обработки: {str(processing_duration)} секунд")
 
     def apply_zor(self, las, name, max_iter=100, z_sigma_threshold=3):
+        import numpy as np
+
         # Применение алгоритма ZOR (Z-Score Outlier Rejection)
         original_count = len(las.points)
         z = las.z
@@ -245,15 +250,14 @@ class LasAnalyzerApp(QWidget):
             z = las.z  # Обновляем массив z после удаления точек
 
         removed_points = original_count - len(las.points)
+        return removed_points
 
-
+    def save_filtered(self, las, name):
         # Сохранение очищенного файла
         if self.save_directory:
             save_path = os.path.join(self.save_directory, os.path.basename(name))
             las.write(save_path)
 
-        return removed_points
-
 if __name__ == "__main__":
     app = QApplication(sys.argv)
     window = LasAnalyzerApp()
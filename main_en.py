@@ -1,13 +1,13 @@
 import sys
 import os
-import laspy
-import numpy as np
 from PyQt6.QtWidgets import (
     QApplication, QWidget, QPushButton, QFileDialog, QLabel, QVBoxLayout,
     QTableWidget, QTableWidgetItem, QProgressBar, QComboBox, QLineEdit
 )
 from datetime import datetime
 
+STATS_TABLE_COLUMNS = list(range(1, 8)) + list(range(9, 17))
+
 class LasAnalyzerApp(QWidget):
     def __init__(self):
         super().__init__()
@@ -27,9 +27,10 @@ class LasAnalyzerApp(QWidget):
         self.btn_select_save_dir = QPushButton("Select Save Directory", self)
 
         self.table_files = QTableWidget(self)
-        self.table_files.setColumnCount(9)
+        self.table_files.setColumnCount(17)
         self.table_files.setHorizontalHeaderLabels(
-            ["File", "Points", "dx", "dy", "dz", "dr", "dg", "db", "Removed Points"]
+            ["File", "Points", "dx", "dy", "dz", "dr", "dg", "db", "Removed Points",
+             "Z p5", "Z p50", "Z p95", "Density, pts/m²", "Intensity mean", "Intensity σ", "Z outliers", "Classes"]
         )
 
         self.table_stats = QTableWidget(self)
@@ -96,6 +97,9 @@ class LasAnalyzerApp(QWidget):
             self.save_path_label.setText(f"Save path: {directory}")
 
     def analyze_files(self):
+        import numpy as np
+        from las_stats import cached_file_stats, format_stats_row
+
         if not self.las_files:
             self.table_files.setRowCount(0)
             return
@@ -105,44 +109,24 @@ class LasAnalyzerApp(QWidget):
         self.label_end_time.setText("")
         self.label_total_time.setText("")
 
-        total_points = []
-        dx_list, dy_list, dz_list = [], [], []
-        dr_list, dg_list, db_list = [], [], []
-
         total_files = len(self.las_files)
         self.progress_bar.setRange(0, total_files)
 
         start_time = datetime.now()
 
+        all_stats = []
         for i, file in enumerate(self.las_files):
-            las = laspy.read(file)
-            dx, dy, dz = las.x.max() - las.x.min(), las.y.max() - las.y.min(), las.z.max() - las.z.min()
-            dx_list.append(dx)
-            dy_list.append(dy)
-            dz_list.append(dz)
-
-            if hasattr(las, 'red') and hasattr(las, 'green') and hasattr(las, 'blue'):
-                dr = las.red.max() - las.red.min()
-                dg = las.green.max() - las.green.min()
-                db = las.blue.max() - las.blue.min()
-                dr_list.append(dr)
-                dg_list.append(dg)
-                db_list.append(db)
-
-            total_points.append(len(las.points))
-
-            self.table_files.setItem(i, 1, QTableWidgetItem(str(total_points[-1])))
-            self.table_files.setItem(i, 2, QTableWidgetItem(f"{dx:.2f}"))
-            self.table_files.setItem(i, 3, QTableWidgetItem(f"{dy:.2f}"))
-            self.table_files.setItem(i, 4, QTableWidgetItem(f"{dz:.2f}"))
-            if dr_list:
-                self.table_files.setItem(i, 5, QTableWidgetItem(f"{dr:.2f}"))
-                self.table_files.setItem(i, 6, QTableWidgetItem(f"{dg:.2f}"))
-                self.table_files.setItem(i, 7, QTableWidgetItem(f"{db:.2f}"))
-
+            all_stats.append(cached_file_stats(file))
             self.progress_bar.setValue(i + 1)
             self.label_processing.setText(f"Processing: {i + 1} of {total_files} files ({self.files_names[i]})")
 
+        self.table_files.setUpdatesEnabled(False)
+        for i, stats in enumerate(all_stats):
+            for column, text in zip(STATS_TABLE_COLUMNS, format_stats_row(stats)):
+                self.table_files.setItem(i, column, QTableWidgetItem(text))
+        self.table_files.setUpdatesEnabled(True)
+
+        total_points = [stats["points"] for stats in all_stats]
         if total_points:
             avg_points = np.mean(total_points)
             min_points, max_points = min(total_points), max(total_points)
@@ -157,6 +141,10 @@ class LasAnalyzerApp(QWidget):
         self.label_total_time.setText(f"Processing time: {duration} seconds")
 
     def start_cleaning(self):
+        import laspy
+        import numpy as np
+        from pipeline import run_pipeline
+
         if not self.las_files or not self.save_directory:
             return
 
@@ -174,27 +162,44 @@ class LasAnalyzerApp(QWidget):
 
         start_time = datetime.now()
 
-        for i, file in enumerate(self.las_files):
-            las = laspy.read(file)
+        def read(job):
+            return laspy.read(job[1])
+
+        def process(job, las):
             if len(las.points) > points_limit:
                 selected_indices = np.random.choice(len(las.points), points_limit, replace=False)
                 las.points = las.points[selected_indices]
 
             if algorithm == "ZOR":
-                name = os.path.basename(file)
-                original_point_count = len(las.points)
-                removed_points = self.apply_zor(las, name)
+                name = os.path.basename(job[1])
+                return las, self.apply_zor(las, name)
+            return None
+
+        def write(job, result):
+            if result is None:
+                return None
+            las, removed_points = result
+            self.save_filtered(las, os.path.basename(job[1]))
+            return removed_points
+
+        def done(job, removed_points):
+            i, file = job
+            if removed_points is not None:
                 self.table_files.setItem(i, 8, QTableWidgetItem(str(removed_points)))
 
             self.progress_bar.setValue(i + 1)
             self.label_processing.setText(f"Processing: {i + 1} of {total_files} files ({self.files_names[i]})")
 
+        run_pipeline(enumerate(self.las_files), read, process, write, on_done=done)
+
         end_time = datetime.now()
         duration = round((end_time - start_time).total_seconds(), 1)
         self.label_end_time.setText(f"Finished: {end_time.strftime('%Y-%m-%d %H:%M:%S')}")
         self.label_total_time.setText(f"Processing time: {duration} seconds")
 
     def apply_zor(self, las, name, max_iter=100, z_sigma_threshold=3):
+        import numpy as np
+
         original_count = len(las.points)
         z = las.z
         for iteration in range(max_iter):
@@ -208,10 +213,12 @@ class LasAnalyzerApp(QWidget):
             las.points = las.points[valid_indices]
             z = las.z
         removed_points = original_count - len(las.points)
+        return removed_points
+
+    def save_filtered(self, las, name):
         if self.save_directory:
             save_path = os.path.join(self.save_directory, os.path.basename(name))
             las.write(save_path)
-        return removed_points
 
 if __name__ == "__main__":
     app = QApplication(sys.argv)
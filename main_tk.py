@@ -1,12 +1,11 @@
 import os
 import sys
 import ctypes
-import laspy
-import numpy as np
 from datetime import datetime
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-from local_filter import full_filter_las
+# laspy, numpy и local_filter импортируются в методах: окно появляется сразу,
+# а scipy загружается только при первой очистке
 
 # --- Отключение размытия на Windows ---
 try:
@@ -14,6 +13,9 @@ try:
 except Exception:
     pass
 
+# Колонки table_files, заполняемые по format_stats_row (8 - "Removed Points")
+STATS_TABLE_COLUMNS = list(range(1, 8)) + list(range(9, 17))
+
 class LasAnalyzerApp(tk.Tk):
     def __init__(self):
         super().__init__()
@@ -45,7 +47,8 @@ class LasAnalyzerApp(tk.Tk):
         self.save_path_label = tk.Label(self, text="Select a directory to save cleaned files:")
         self.btn_select_save_dir = tk.Button(self, text="Select Save Directory", command=self.select_save_directory)
 
-        columns_files = ["File", "Points", "dx", "dy", "dz", "dr", "dg", "db", "Removed Points"]
+        columns_files = ["File", "Points", "dx", "dy", "dz", "dr", "dg", "db", "Removed Points",
+                         "Z p5", "Z p50", "Z p95", "Density, pts/m²", "Intensity mean", "Intensity σ", "Z outliers", "Classes"]
         self.table_files = ttk.Treeview(self, columns=columns_files, show='headings')
 
         for col in columns_files:
@@ -128,7 +131,7 @@ class LasAnalyzerApp(tk.Tk):
 
             self.table_files.delete(*self.table_files.get_children())
             for file in self.files_names:
-                self.table_files.insert("", "end", values=(file,) + ("",)*8)  # заполняем пустыми столбцами
+                self.table_files.insert("", "end", values=(file,) + ("",)*(len(self.table_files["columns"]) - 1))  # заполняем пустыми столбцами
 
     def select_save_directory(self):
         directory = filedialog.askdirectory(title="Select save directory")
@@ -137,6 +140,9 @@ class LasAnalyzerApp(tk.Tk):
             self.save_path_label.config(text=f"Save path: {directory}")
 
     def analyze_files(self):
+        import numpy as np
+        from las_stats import cached_file_stats, format_stats_row
+
         if not self.las_files:
             messagebox.showwarning("Warning", "No LAS files selected.")
             return
@@ -146,49 +152,28 @@ class LasAnalyzerApp(tk.Tk):
         self.label_end_time.config(text="")
         self.label_total_time.config(text="")
 
-        total_points = []
-        dx_list, dy_list, dz_list = [], [], []
-        dr_list, dg_list, db_list = [], [], []
-
         total_files = len(self.las_files)
         self.progress_bar.config(maximum=total_files)
 
         start_time = datetime.now()
 
+        all_stats = []
         for i, file in enumerate(self.las_files):
             print(f'Now is analysing {file}')
-            las = laspy.read(file)
-            dx, dy, dz = las.x.max() - las.x.min(), las.y.max() - las.y.min(), las.z.max() - las.z.min()
-            dx_list.append(dx)
-            dy_list.append(dy)
-            dz_list.append(dz)
-
-            if hasattr(las, 'red') and hasattr(las, 'green') and hasattr(las, 'blue'):
-                dr = las.red.max() - las.red.min()
-                dg = las.green.max() - las.green.min()
-                db = las.blue.max() - las.blue.min()
-                dr_list.append(dr)
-                dg_list.append(dg)
-                db_list.append(db)
-
-            total_points.append(len(las.points))
-
-            # Обновляем таблицу
-            values = list(self.table_files.item(self.table_files.get_children()[i])['values'])
-            values[1] = str(total_points[-1])
-            values[2] = f"{dx:.2f}"
-            values[3] = f"{dy:.2f}"
-            values[4] = f"{dz:.2f}"
-            if dr_list:
-                values[5] = f"{dr:.2f}"
-                values[6] = f"{dg:.2f}"
-                values[7] = f"{db:.2f}"
-            self.table_files.item(self.table_files.get_children()[i], values=values)
-
+            all_stats.append(cached_file_stats(file))
             self.progress_var.set(i + 1)
             self.label_processing.config(text=f"Processing: {i + 1} of {total_files} files ({self.files_names[i]})")
             self.update_idletasks()
 
+        # Обновляем таблицу целиком после анализа
+        rows = self.table_files.get_children()
+        for row, stats in zip(rows, all_stats):
+            values = list(self.table_files.item(row)['values'])
+            for column, text in zip(STATS_TABLE_COLUMNS, format_stats_row(stats)):
+                values[column] = text
+            self.table_files.item(row, values=values)
+
+        total_points = [stats["points"] for stats in all_stats]
         if total_points:
             avg_points = np.mean(total_points)
             min_points, max_points = min(total_points), max(total_points)
@@ -201,6 +186,9 @@ class LasAnalyzerApp(tk.Tk):
         self.label_total_time.config(text=f"Processing time: {duration} seconds")
 
     def start_cleaning(self):
+        import laspy
+        from pipeline import run_pipeline
+
         if not self.las_files:
             messagebox.showwarning("Warning", "No LAS files selected.")
             return
@@ -220,14 +208,27 @@ class LasAnalyzerApp(tk.Tk):
 
         start_time = datetime.now()
 
-        for i, file in enumerate(self.las_files):
+        # Чтение следующих файлов и запись обработанных идут в фоне (pipeline.py)
+        def read(job):
+            i, file = job
             print(f'loading file: {file}')
-            las = laspy.read(file)
-
-            if algorithm == "ZOR":
-                name = os.path.basename(file)
-                removed_points = self.apply_filter(las, name, points_limit)
-
+            return laspy.read(file)
+
+        def process(job, las):
+            if algorithm != "ZOR":
+                return None
+            return self.apply_filter(las, os.path.basename(job[1]), points_limit)
+
+        def write(job, result):
+            if result is None:
+                return None
+            las, removed_points = result
+            self.save_filtered(las, os.path.basename(job[1]))
+            return removed_points
+
+        def done(job, removed_points):
+            i, file = job
+            if removed_points is not None:
                 # Обновляем таблицу с количеством удаленных точек
                 values = list(self.table_files.item(self.table_files.get_children()[i])['values'])
                 values[8] = str(removed_points)
@@ -237,21 +238,26 @@ class LasAnalyzerApp(tk.Tk):
             self.label_processing.config(text=f"Processing: {i + 1} of {total_files} files ({self.files_names[i]})")
             self.update_idletasks()
 
+        run_pipeline(enumerate(self.las_files), read, process, write, on_done=done)
+
         end_time = datetime.now()
         duration = round((end_time - start_time).total_seconds(), 1)
         self.label_end_time.config(text=f"Finished: {end_time.strftime('%Y-%m-%d %H:%M:%S')}")
         self.label_total_time.config(text=f"Processing time: {duration} seconds")
 
     def apply_filter(self, las, name, N_points):
+        from local_filter import full_filter_las
+
         org_points = len(las)
         print(f'file: {name} is cleaning')
         print(f'from {org_points} points to {N_points} points')
         las = full_filter_las(las, N_points)
+        return las, org_points-N_points
 
+    def save_filtered(self, las, name):
         if self.save_directory:
             save_path = os.path.join(self.save_directory, os.path.basename(name))
             las.write(save_path)
-        return org_points-N_points
 
 if __name__ == "__main__":
     app = LasAnalyzerApp()
@@ -0,0 +1,172 @@
+"""Многопроцессная локальная фильтрация одного большого тайла.
+
+Координаты точек один раз копируются в multiprocessing.shared_memory,
+отсортированными по Y; воркеры подключаются к этому блоку по имени и
+работают с ним без пересылки и копирования точек:
+
+1. средние высоты узлов сетки - по полосам строк сетки, каждый воркер
+   строит KD-дерево только по точкам своей полосы с запасом по Y (полоса -
+   непрерывный диапазон индексов, находится бинарным поиском);
+2. невязки - по непересекающимся диапазонам индексов точек
+   (blocked_residuals), каждый воркер возвращает только статистику для σ;
+3. маска - порог по невязкам в тех же диапазонах, в общий массив.
+"""
+import os
+import numpy as np
+from multiprocessing import get_context
+from multiprocessing.shared_memory import SharedMemory
+
+from las_stats import RunningStats
+from local_filter import (calculate_grid_bounds, generate_grid, interpolate_surface, blocked_residuals,
+                          NOISE_CLASS)
+
+TASKS_PER_WORKER = 4
+
+# Состояние воркера: подключённый блок общей памяти и представления в нём
+_shm = None
+_xyz = None
+_residuals = None
+_mask = None
+_surface = None
+
+
+def _shared_arrays(buffer, n_points):
+    xyz = np.ndarray((3, n_points), dtype=np.float64, buffer=buffer)
+    residuals = np.ndarray(n_points, dtype=np.float64, buffer=buffer, offset=xyz.nbytes)
+    mask = np.ndarray(n_points, dtype=bool, buffer=buffer, offset=xyz.nbytes + residuals.nbytes)
+    return xyz, residuals, mask
+
+
+def _init_worker(shm_name, n_points):
+    global _shm, _xyz, _residuals, _mask
+    _shm = SharedMemory(name=shm_name)
+    _xyz, _residuals, _mask = _shared_arrays(_shm.buf, n_points)
+
+
+def _band_mean_heights(task):
+    """Средние высоты K ближайших точек для узлов полосы строк сетки.
+
+    Дерево строится по точкам полосы с запасом margin по Y. Если K-й сосед
+    узла дальше границы запаса (а за ней ещё есть точки), результат может
+    быть неполным: такие узлы пересчитываются с удвоенным запасом.
+    """
+    from scipy.spatial import cKDTree
+
+    nodes, K, margin, y_min, y_max = task
+    x, y, z = _xyz  # точки отсортированы по y
+    band_lo, band_hi = nodes[:, 1].min(), nodes[:, 1].max()
+    z_means = np.empty(len(nodes))
+    pending = np.arange(len(nodes))
+
+    while len(pending):
+        lo, hi = band_lo - margin, band_hi + margin
+        covers_all = lo <= y_min and hi >= y_max
+        start, end = np.searchsorted(y, lo, side="left"), np.searchsorted(y, hi, side="right")
+        if end - start >= K:
+            tree = cKDTree(np.column_stack((x[start:end], y[start:end])))
+            distances, indices = tree.query(nodes[pending], k=K)
+            distances = distances.reshape(len(pending), -1)
+            indices = indices.reshape(len(pending), -1)
+
+            node_y = nodes[pending, 1]
+            reach_lo = np.where(lo > y_min, node_y - lo, np.inf)
+            reach_hi = np.where(hi < y_max, hi - node_y, np.inf)
+            complete = distances[:, -1] <= np.minimum(reach_lo, reach_hi)
+
+            z_means[pending[complete]] = np.mean(z[start + indices[complete]], axis=1)
+            pending = pending[~complete]
+        elif covers_all:
+            raise ValueError(f"Not enough points for K={K}: {end - start}")
+        margin *= 2
+    return z_means
+
+
+def _range_residuals(task):
+    """Невязки для диапазона точек и их статистика (count, mean, M2, число валидных)"""
+    global _surface
+    start, end, surface_key, grid_points, z_means = task
+    if _surface is None or _surface[0] != surface_key:
+        _surface = (surface_key, interpolate_surface(grid_points, z_means))
+    x, y, z = _xyz[:, start:end]
+    stats, n_valid = blocked_residuals(x, y, z, _surface[1], _residuals[start:end])
+    return stats.count, stats.mean, stats.m2, n_valid
+
+
+def _range_mask(task):
+    start, end, threshold = task
+    np.less_equal(_residuals[start:end], threshold, out=_mask[start:end])
+    return int(np.count_nonzero(_mask[start:end]))
+
+
+def _split(n, parts):
+    bounds = np.linspace(0, n, parts + 1).astype(int)
+    return [(a, b) for a, b in zip(bounds[:-1], bounds[1:]) if b > a]
+
+
+def parallel_filter_mask(x, y, z, M=100, K=10, sigma_multiplier=2, workers=None):
+    """Маска локального фильтра, посчитанная в workers процессах.
+
+    Результат совпадает с compute_filter_mask с точностью до выбора между
+    равноудалёнными K-ми соседями и округления при объединении σ по частям.
+    Возвращает (маска, число точек с валидным z_pred).
+    """
+    workers = workers or os.cpu_count() or 1
+    n_points = len(z)
+    if n_points < K:
+        raise ValueError(f"Not enough points for K={K}: {n_points}")
+
+    # сортировка по Y один раз в родителе: полоса строк сетки у воркера -
+    # непрерывный срез, а не просмотр всех N точек в каждой задаче
+    order = np.argsort(y, kind="stable")
+    size = n_points * (3 * 8 + 8 + 1)
+    shm = SharedMemory(create=True, size=size)
+    try:
+        xyz, residuals, mask = _shared_arrays(shm.buf, n_points)
+        for row, values in enumerate((x, y, z)):
+            np.take(np.asarray(values, dtype=np.float64), order, out=xyz[row])
+
+        xmin, xmax, ymin, ymax = calculate_grid_bounds(xyz[:2].T)
+        grid_points = generate_grid(xmin, xmax, ymin, ymax, M)
+        area = max((xmax - xmin) * (ymax - ymin), 1e-12)
+        margin = max(2 * np.sqrt(K * area / (np.pi * n_points)), (ymax - ymin) / max(M - 1, 1))
+
+        with get_context().Pool(workers, initializer=_init_worker, initargs=(shm.name, n_points)) as pool:
+            row_bands = _split(M, min(M, workers * TASKS_PER_WORKER))
+            band_tasks = [(grid_points[a * M:b * M], K, margin, ymin, ymax) for a, b in row_bands]
+            z_means = np.concatenate(pool.map(_band_mean_heights, band_tasks))
+
+            ranges = _split(n_points, workers * TASKS_PER_WORKER)
+            surface_key = (shm.name, n_points)
+            partials = pool.map(_range_residuals, [(a, b, surface_key, grid_points, z_means) for a, b in ranges])
+            stats = RunningStats()
+            for count, mean, m2, _ in partials:
+                stats.merge(count, mean, m2)
+            n_valid = sum(partial[3] for partial in partials)
+
+            threshold = sigma_multiplier * stats.std
+            pool.map(_range_mask, [(a, b, threshold) for a, b in ranges])
+
+        result = np.empty(n_points, dtype=bool)
+        result[order] = mask
+    finally:
+        # представления должны исчезнуть до close(), в том числе при ошибке
+        xyz = residuals = mask = None
+        shm.close()
+        shm.unlink()
+    return result, n_valid
+
+
+def parallel_local_filter_las(las, M=100, K=10, sigma_multiplier=2, workers=None, mark_noise=False):
+    """local_filter_las с распараллеливанием внутри тайла.
+
+    mark_noise=True, как и в local_filter_las, присваивает отбракованным
+    точкам класс NOISE_CLASS вместо удаления.
+    """
+    mask, _ = parallel_filter_mask(las.x, las.y, las.z, M, K, sigma_multiplier, workers)
+    if mark_noise:
+        classification = np.array(las.classification)
+        classification[~mask] = NOISE_CLASS
+        las.classification = classification
+    else:
+        las.points = las.points[mask]
+    return las
@@ -0,0 +1,83 @@
+"""Конвейер чтение -> обработка -> запись для пакетной очистки.
+
+Пока обрабатывается текущий файл, следующие prefetch файлов уже читаются,
+а результаты предыдущих записываются в фоне. Очереди между стадиями
+ограничены, так что в памяти одновременно не больше
+prefetch + write_behind + 3 файлов (по одному в каждой стадии).
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+_DONE = object()
+
+
+async def _read_stage(jobs, read_fn, read_queue, executor):
+    loop = asyncio.get_running_loop()
+    for job in jobs:
+        data = await loop.run_in_executor(executor, read_fn, job)
+        await read_queue.put((job, data))
+    await read_queue.put(_DONE)
+
+
+async def _process_stage(process_fn, read_queue, write_queue, executor):
+    loop = asyncio.get_running_loop()
+    while True:
+        item = await read_queue.get()
+        if item is _DONE:
+            break
+        job, data = item
+        del item  # не держим прочитанные данные дольше, чем нужно
+        result = await loop.run_in_executor(executor, process_fn, job, data)
+        del data
+        await write_queue.put((job, result))
+    await write_queue.put(_DONE)
+
+
+async def _write_stage(write_fn, write_queue, executor, on_done):
+    loop = asyncio.get_running_loop()
+    results = []
+    while True:
+        item = await write_queue.get()
+        if item is _DONE:
+            break
+        job, result = item
+        del item
+        summary = await loop.run_in_executor(executor, write_fn, job, result)
+        del result
+        if on_done is not None:
+            on_done(job, summary)
+        results.append((job, summary))
+    return results
+
+
+async def _run_pipeline(jobs, read_fn, process_fn, write_fn, prefetch, write_behind, on_done):
+    read_queue = asyncio.Queue(maxsize=max(prefetch, 1))
+    write_queue = asyncio.Queue(maxsize=max(write_behind, 1))
+    # по одному потоку на стадию: стадии перекрываются, но каждая идёт по порядку
+    with ThreadPoolExecutor(1, thread_name_prefix="las-read") as read_executor, \
+            ThreadPoolExecutor(1, thread_name_prefix="las-process") as process_executor, \
+            ThreadPoolExecutor(1, thread_name_prefix="las-write") as write_executor:
+        tasks = [
+            asyncio.ensure_future(_read_stage(jobs, read_fn, read_queue, read_executor)),
+            asyncio.ensure_future(_process_stage(process_fn, read_queue, write_queue, process_executor)),
+            asyncio.ensure_future(_write_stage(write_fn, write_queue, write_executor, on_done)),
+        ]
+        try:
+            results = await asyncio.gather(*tasks)
+        except BaseException:
+            for task in tasks:
+                task.cancel()
+            raise
+    return results[-1]
+
+
+def run_pipeline(jobs, read_fn, process_fn, write_fn, prefetch=2, write_behind=2, on_done=None):
+    """Прогнать задачи через конвейер из трёх стадий.
+
+    read_fn(job) -> data выполняется в потоке чтения,
+    process_fn(job, data) -> result - в потоке обработки,
+    write_fn(job, result) -> summary - в потоке записи.
+    on_done(job, summary) вызывается в вызывающем потоке после записи каждого
+    файла, в порядке jobs. Возвращает список (job, summary).
+    """
+    return asyncio.run(_run_pipeline(list(jobs), read_fn, process_fn, write_fn, prefetch, write_behind, on_done))
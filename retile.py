@@ -0,0 +1,127 @@
+"""Пространственно упорядоченная запись очищенных точек.
+
+Точки сортируются вдоль кривой Мортона (Z-order) и при необходимости
+режутся на квадратные тайлы и на части не больше max_points точек.
+Каждая часть - обычный LAS/LAZ с пересчитанным заголовком, а рядом
+пишется индекс с границами частей, чтобы чтение области открывало только
+пересекающиеся с ней файлы.
+"""
+import os
+import copy
+import json
+import numpy as np
+
+MORTON_BITS = 16
+
+
+def _spread_bits(values):
+    """Раздвинуть биты 32-битных чисел через один (0b1011 -> 0b1000101)"""
+    v = values.astype(np.uint64) & np.uint64(0xFFFFFFFF)
+    v = (v | (v << np.uint64(16))) & np.uint64(0x0000FFFF0000FFFF)
+    v = (v | (v << np.uint64(8))) & np.uint64(0x00FF00FF00FF00FF)
+    v = (v | (v << np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    v = (v | (v << np.uint64(2))) & np.uint64(0x3333333333333333)
+    v = (v | (v << np.uint64(1))) & np.uint64(0x5555555555555555)
+    return v
+
+
+def morton_codes(x, y, bounds=None, bits=MORTON_BITS):
+    """Коды Мортона для точек, квантованных на сетку 2**bits x 2**bits"""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    if bounds is None:
+        bounds = (x.min(), x.max(), y.min(), y.max())
+    xmin, xmax, ymin, ymax = bounds
+    cells = (1 << bits) - 1
+    qx = np.clip((x - xmin) / max(xmax - xmin, 1e-12) * cells, 0, cells).astype(np.uint64)
+    qy = np.clip((y - ymin) / max(ymax - ymin, 1e-12) * cells, 0, cells).astype(np.uint64)
+    return _spread_bits(qx) | (_spread_bits(qy) << np.uint64(1))
+
+
+def spatial_order(las):
+    """Перестановка точек в порядке кривой Мортона"""
+    return np.argsort(morton_codes(las.x, las.y), kind="stable")
+
+
+def sort_las_spatially(las):
+    """Переупорядочить точки las вдоль кривой Мортона"""
+    las.points = las.points[spatial_order(las)]
+    return las
+
+
+def _write_subset(las, indices, file_path):
+    import laspy
+
+    part = laspy.LasData(header=copy.deepcopy(las.header), points=las.points[indices])
+    part.write(file_path)  # laspy пересчитывает число точек и границы в заголовке
+    x, y, z = np.asarray(part.x), np.asarray(part.y), np.asarray(part.z)
+    return {
+        "file": os.path.basename(file_path),
+        "points": len(indices),
+        "mins": [float(x.min()), float(y.min()), float(z.min())],
+        "maxs": [float(x.max()), float(y.max()), float(z.max())],
+    }
+
+
+def write_tiles(las, output_path, tile_size=None, max_points=None):
+    """Записать точки частями, упорядоченными вдоль кривой Мортона.
+
+    tile_size - сторона квадратного тайла в единицах координат (None - без
+    разбиения на тайлы), max_points - предельное число точек в одном файле.
+    Тайл (i, j) покрывает [i * tile_size, (i + 1) * tile_size) по X и так же
+    по Y, т.е. сетка тайлов общая для всех входных файлов.
+    Файлы называются <имя>_<тайл x>_<тайл y>_<часть>.<расширение>, индекс
+    пишется в <имя>_index.json. Возвращает список записей индекса.
+    """
+    output_dir = os.path.dirname(output_path) or "."
+    base_name, ext = os.path.splitext(os.path.basename(output_path))
+    os.makedirs(output_dir, exist_ok=True)
+
+    x, y = np.asarray(las.x), np.asarray(las.y)
+    if len(x) == 0:
+        return []
+    order = np.argsort(morton_codes(x, y), kind="stable")
+
+    if tile_size:
+        # сетка тайлов от начала координат, чтобы тайлы соседних входных
+        # файлов совпадали и номер тайла имел один смысл для всех файлов
+        tile_x = np.floor(x[order] / tile_size).astype(np.int64)
+        tile_y = np.floor(y[order] / tile_size).astype(np.int64)
+        # стабильная сортировка по тайлу сохраняет порядок Мортона внутри тайла
+        by_tile = np.lexsort((tile_x, tile_y))
+        order, tile_x, tile_y = order[by_tile], tile_x[by_tile], tile_y[by_tile]
+        starts = np.flatnonzero(np.r_[True, (np.diff(tile_x) != 0) | (np.diff(tile_y) != 0)])
+    else:
+        tile_x = tile_y = np.zeros(len(order), dtype=np.int64)
+        starts = np.array([0])
+
+    index = []
+    ends = np.r_[starts[1:], len(order)]
+    for start, end in zip(starts, ends):
+        step = max_points or (end - start)
+        for part, chunk_start in enumerate(range(start, end, step)):
+            chunk = order[chunk_start:min(chunk_start + step, end)]
+            file_name = f"{base_name}_{tile_x[start]}_{tile_y[start]}_{part}{ext}"
+            entry = _write_subset(las, chunk, os.path.join(output_dir, file_name))
+            if tile_size:
+                entry["tile"] = [int(tile_x[start]), int(tile_y[start])]
+            index.append(entry)
+
+    with open(os.path.join(output_dir, f"{base_name}_index.json"), "w", encoding="utf-8") as f:
+        json.dump({"source": os.path.basename(output_path), "tile_size": tile_size,
+                   "tile_origin": [0.0, 0.0] if tile_size else None,
+                   "max_points": max_points, "parts": index}, f, indent=2)
+    return index
+
+
+def parts_in_region(index_path, xmin, xmax, ymin, ymax):
+    """Файлы частей из индекса, пересекающие прямоугольник"""
+    with open(index_path, encoding="utf-8") as f:
+        index = json.load(f)
+    output_dir = os.path.dirname(index_path)
+    return [
+        os.path.join(output_dir, part["file"])
+        for part in index["parts"]
+        if part["mins"][0] <= xmax and part["maxs"][0] >= xmin
+        and part["mins"][1] <= ymax and part["maxs"][1] >= ymin
+    ]
@@ -0,0 +1,135 @@
+"""Подбор параметров локального фильтра (M, K, sigma_multiplier) за один проход.
+
+Тайл читается один раз и KD-дерево строится один раз. Для каждого M
+запрос делается сразу на max(K) соседей: соседи отсортированы по
+расстоянию, поэтому среднее по K ближайшим для любого меньшего K берётся
+из накопленной суммы. Триангуляция сетки и барицентрические веса точек
+тоже считаются один раз на M, а один массив невязок обслуживает все
+значения sigma_multiplier.
+"""
+import sys
+import csv
+import time
+import argparse
+import numpy as np
+
+from local_filter import calculate_grid_bounds, generate_grid, load_las_points
+
+SWEEP_COLUMNS = ["M", "K", "sigma_multiplier", "points", "removed", "removed_fraction",
+                 "setup_seconds", "eval_seconds", "kept_rmse", "removed_mean_residual"]
+
+
+def _barycentric_weights(triangulation, xy):
+    """Номера вершин и барицентрические веса треугольника для каждой точки"""
+    simplex = triangulation.find_simplex(xy)
+    valid = simplex >= 0
+    simplex = np.where(valid, simplex, 0)
+    transform = triangulation.transform[simplex]
+    partial = np.einsum("nij,nj->ni", transform[:, :2], xy - transform[:, 2])
+    weights = np.column_stack((partial, 1 - partial.sum(axis=1)))
+    return triangulation.simplices[simplex], weights, valid
+
+
+def sweep_parameters(points, Ms=(50, 100, 200), Ks=(5, 10, 20), sigma_multipliers=(1.5, 2, 2.5, 3), quality=False):
+    """Число удалённых точек для всех сочетаний (M, K, sigma_multiplier).
+
+    points - массив N x 3. Результат совпадает с compute_filter_mask для
+    каждого сочетания. Возвращает список словарей с колонками SWEEP_COLUMNS
+    (kept_rmse и removed_mean_residual заполняются при quality=True).
+    """
+    from scipy.spatial import cKDTree, Delaunay
+
+    n_points = len(points)
+    xy = np.ascontiguousarray(points[:, :2])
+    z = points[:, 2]
+    Ks = sorted(set(Ks))
+    k_max = Ks[-1]
+
+    start_time = time.perf_counter()
+    tree = cKDTree(xy)
+    tree_seconds = time.perf_counter() - start_time
+    xmin, xmax, ymin, ymax = calculate_grid_bounds(points)
+
+    rows = []
+    for M in Ms:
+        start_time = time.perf_counter()
+        grid_points = generate_grid(xmin, xmax, ymin, ymax, M)
+        _, indices = tree.query(grid_points, k=k_max)
+        neighbour_z = np.cumsum(z[indices.reshape(len(grid_points), -1)], axis=1)
+        vertices, weights, valid = _barycentric_weights(Delaunay(grid_points), xy)
+        setup_seconds = time.perf_counter() - start_time + (tree_seconds if M == Ms[0] else 0)
+
+        for K in Ks:
+            start_time = time.perf_counter()
+            z_means = neighbour_z[:, K - 1] / K
+            z_pred = np.einsum("ni,ni->n", z_means[vertices], weights)
+            residuals = np.abs(z - z_pred)
+            residuals[~valid] = 0  # fallback на оригинальные z
+            sigma = np.std(residuals)
+            k_seconds = time.perf_counter() - start_time
+
+            for sigma_multiplier in sigma_multipliers:
+                start_time = time.perf_counter()
+                mask = residuals <= sigma_multiplier * sigma
+                kept = int(np.count_nonzero(mask))
+                row = {
+                    "M": M,
+                    "K": K,
+                    "sigma_multiplier": sigma_multiplier,
+                    "points": n_points,
+                    "removed": n_points - kept,
+                    "removed_fraction": (n_points - kept) / n_points,
+                    "kept_rmse": None,
+                    "removed_mean_residual": None,
+                }
+                if quality:
+                    row["kept_rmse"] = float(np.sqrt(np.mean(np.square(residuals[mask])))) if kept else np.nan
+                    row["removed_mean_residual"] = float(residuals[~mask].mean()) if kept < n_points else np.nan
+                row["setup_seconds"] = setup_seconds
+                row["eval_seconds"] = k_seconds / len(sigma_multipliers) + time.perf_counter() - start_time
+                rows.append(row)
+    return rows
+
+
+def sweep_las_file(input_file, **kwargs):
+    """sweep_parameters для LAS-файла"""
+    points, header, las = load_las_points(input_file)
+    return sweep_parameters(points, **kwargs)
+
+
+def write_sweep_table(rows, file_path):
+    """Сохранить результаты перебора в CSV"""
+    with open(file_path, "w", newline="", encoding="utf-8") as f:
+        writer = csv.DictWriter(f, fieldnames=SWEEP_COLUMNS)
+        writer.writeheader()
+        writer.writerows(rows)
+
+
+def print_sweep_table(rows):
+    print(f"{'M':>5} {'K':>4} {'sigma':>6} {'removed':>10} {'removed %':>10} {'setup s':>8} {'eval s':>8} {'kept rmse':>10}")
+    for row in rows:
+        rmse = "" if row["kept_rmse"] is None else f"{row['kept_rmse']:.4f}"
+        print(f"{row['M']:>5} {row['K']:>4} {row['sigma_multiplier']:>6} {row['removed']:>10} "
+              f"{row['removed_fraction']:>10.2%} {row['setup_seconds']:>8.3f} {row['eval_seconds']:>8.3f} {rmse:>10}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate many (M, K, sigma) combinations of the local filter on one tile")
+    parser.add_argument("input_file")
+    parser.add_argument("--M", type=int, nargs="+", default=[50, 100, 200])
+    parser.add_argument("--K", type=int, nargs="+", default=[5, 10, 20])
+    parser.add_argument("--sigma", type=float, nargs="+", default=[1.5, 2, 2.5, 3])
+    parser.add_argument("--quality", action="store_true", help="compute residual quality metrics")
+    parser.add_argument("--csv", help="write the table to a CSV file")
+    args = parser.parse_args(argv)
+
+    start_time = time.perf_counter()
+    rows = sweep_las_file(args.input_file, Ms=args.M, Ks=args.K, sigma_multipliers=args.sigma, quality=args.quality)
+    print_sweep_table(rows)
+    print(f"{len(rows)} combinations in {time.perf_counter() - start_time:.1f} s")
+    if args.csv:
+        write_sweep_table(rows, args.csv)
+
+
+if __name__ == "__main__":
+    sys.exit(main())